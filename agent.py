@@ -0,0 +1,106 @@
+from typing import List
+
+from council.agents import Agent, AgentResult
+from council.contexts import AgentContext, ChainContext, Monitored
+from council.controllers import ExecutionUnit
+from council.runners import RunnerExecutor, new_runner_executor
+
+
+class ParallelAgent(Agent):
+    """
+    An agent that executes the chains of the execution plan concurrently instead of one after the other,
+    so that an iteration takes as long as its slowest chain.
+
+    Based on Agent: https://github.com/chain-ml/council/blob/main/council/agents/agent.py
+    """
+
+    def _execute(self, context: AgentContext) -> AgentResult:
+        executor = new_runner_executor("agent")
+        try:
+            context.logger.info('message="agent execution started"')
+            while not context.budget.is_expired():
+                with context.new_agent_context_for_new_iteration() as iteration_context:
+                    context.logger.info(
+                        f'message="agent iteration started" iteration="{iteration_context.iteration_count - 1}"'
+                    )
+                    plan = self.controller.execute(
+                        context=iteration_context.new_agent_context_for(
+                            self._controller
+                        )
+                    )
+                    context.logger.debug(
+                        f'message="agent controller returned {len(plan)} execution plan(s)"'
+                    )
+
+                    if len(plan) == 0:
+                        return AgentResult()
+
+                    self._execute_plan(executor, iteration_context, plan)
+
+                    result = self.evaluator.execute(
+                        iteration_context.new_agent_context_for(self._evaluator)
+                    )
+                    iteration_context.set_evaluation(result)
+
+                    result = self.filter.execute(
+                        context=iteration_context.new_agent_context_for(self._filter)
+                    )
+                    context.logger.debug(
+                        "controller selected %d responses", len(result)
+                    )
+                    if len(result) > 0:
+                        return AgentResult(messages=result)
+
+            return AgentResult()
+        finally:
+            context.logger.info('message="agent execution ended"')
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _execute_plan(
+        self,
+        executor: RunnerExecutor,
+        context: AgentContext,
+        plan: List[ExecutionUnit],
+    ):
+        """Execute the chains of the plan in the executor and wait for all of them to end"""
+        # Chain contexts are created in plan order, so that the evaluator sees the chain responses in that order
+        unit_contexts = [
+            context.new_agent_context_for_execution_unit(unit.name) for unit in plan
+        ]
+        chain_contexts = [
+            self._new_chain_context(unit_context, unit)
+            for unit_context, unit in zip(unit_contexts, plan)
+        ]
+        units = [
+            executor.submit(self._execute_chain, unit_context, chain_context, unit)
+            for unit_context, chain_context, unit in zip(
+                unit_contexts, chain_contexts, plan
+            )
+        ]
+        # Re-raise the first error of a chain, as executing the units one after the other would
+        for unit in units:
+            unit.result()
+
+    @staticmethod
+    def _new_chain_context(context: AgentContext, unit: ExecutionUnit) -> ChainContext:
+        chain = unit.chain
+        chain_context = ChainContext.from_agent_context(
+            context, Monitored(f"chain({chain.name})", chain), unit.name, unit.budget
+        )
+        if unit.initial_state is not None:
+            chain_context.append(unit.initial_state)
+        return chain_context
+
+    @staticmethod
+    def _execute_chain(
+        context: AgentContext, chain_context: ChainContext, unit: ExecutionUnit
+    ):
+        chain = unit.chain
+        with context:
+            context.logger.info(
+                f'message="chain execution started" chain="{chain.name}" execution_unit="{unit.name}"'
+            )
+            chain.execute(chain_context)
+            context.logger.info(
+                f'message="chain execution ended" chain="{chain.name}" execution_unit="{unit.name}"'
+            )
@@ -4,36 +4,61 @@ from string import Template
 
 from council.chains import Chain
 from council.evaluators import BasicEvaluator
-from council.llm import OpenAILLM, LLMMessage
+from council.llm import LLMMessage
 from council.skills import LLMSkill, PromptToMessages
 from council.contexts import SkillContext
 from council.prompt import PromptBuilder
 from council.runners import Parallel
 
 import constants
-from config import Config
-from skills import (
-    DocRetrievalSkill,
-    GoogleAggregatorSkill,
-    PandasSkill,
-    CustomGoogleNewsSkill,
-    CustomGoogleSearchSkill,
-)
-from retrieval import Retriever
 from controller import Controller
 from filter import LLMFilter
 
-import dotenv
+ANSWER_PROMPT = Template(
+    """Use the following pieces of context to answer the query.
+        If the answer is not provided in the context, do not make up an answer. Instead, respond that you do not know.
+
+        CONTEXT:
+        $context
+        END CONTEXT.
+
+        QUERY:
+        $query
+        END QUERY.
+
+        YOUR ANSWER:
+        """
+)
 
-dotenv.load_dotenv()
+# Prompt for LLMSkill answering from the previous skill's message in the chain
+CONTEXT_PROMPT = ANSWER_PROMPT.substitute(
+    context="{{chain_history.last_message}}",
+    query="{{chat_history.user.last_message}}",
+)
 
 
 class AgentConfig:
     def __init__(self):
+        # Heavy dependencies (index, models, skills) are built on first use in ensure_ready()
+        self._ready = False
+
+    def ensure_ready(self):
+        """Build the document index, skills and chains the first time the agent configuration is requested"""
+        if self._ready:
+            return
+
+        import dotenv
+        from config import Config
+        from llm import PooledOpenAILLM
+        from retrieval import Retriever
+
+        dotenv.load_dotenv()
+
         # Initializing document retrieval dependencies
         self.config = Config(
             encoding_name=constants.ENCODING_NAME,
             embedding_model_name=constants.EMBEDDING_MODEL_NAME,
+            ef_search=constants.HNSW_EF_SEARCH,
         )
         self.index = self.config.initialize()
         self.index_retriever = self.index.as_retriever(
@@ -41,11 +66,13 @@ class AgentConfig:
         )
         self.retriever = Retriever(self.config, self.index_retriever)
 
-        # Initializing agent config
-        self._llm_skill_model = OpenAILLM.from_env(
+        # Initializing agent config, with LLMs sharing one pool of connections to OpenAI
+        self._llm_skill_model = PooledOpenAILLM.from_env(
             model=constants.DOC_AND_GOOGLE_RETRIEVAL_LLM
         )
-        self._controller_model = OpenAILLM.from_env(model=constants.CONTROLLER_LLM)
+        self._controller_model = PooledOpenAILLM.from_env(
+            model=constants.CONTROLLER_LLM
+        )
         self._init_skills()
         self.chains = self._init_chains()
         self.controller = Controller(
@@ -53,8 +80,10 @@ class AgentConfig:
         )
         self.evaluator = BasicEvaluator()
         self.filter = LLMFilter(llm=self._controller_model)
+        self._ready = True
 
     def load_config(self):
+        self.ensure_ready()
         return {
             "controller": self.controller,
             "evaluator": self.evaluator,
@@ -62,13 +91,19 @@ class AgentConfig:
         }
 
     def _init_skills(self):
+        from skills import (
+            DocRetrievalSkill,
+            PandasSkill,
+            CustomGoogleNewsSkill,
+            CustomGoogleSearchSkill,
+        )
+
         # Document retrieval skills
         self.doc_retrieval_skill = DocRetrievalSkill(self.retriever)
 
         # Search skills
         self.google_search_skill = CustomGoogleSearchSkill()
         self.google_news_skill = CustomGoogleNewsSkill()
-        self.google_aggregator_skill = GoogleAggregatorSkill()
 
         # Pandas skills
         self.pandas_skill = PandasSkill(
@@ -76,13 +111,23 @@ class AgentConfig:
         )
 
         # LLM Skill
+        self._context_message_prompt = PromptToMessages(
+            prompt_builder=PromptBuilder(CONTEXT_PROMPT)
+        )
+        system_prompt = Template(
+            "You are a financial analyst whose job is to answer user questions about $company with the provided context."
+        ).substitute(company=constants.COMPANY_NAME)
         self.llm_skill = LLMSkill(
             llm=self._llm_skill_model,
-            system_prompt=Template(
-                "You are a financial analyst whose job is to answer user questions about $company with the provided context."
-            ).substitute(company=constants.COMPANY_NAME),
+            system_prompt=system_prompt,
             context_messages=self._build_context_messages,
         )
+        # Answers directly from the Google results, without an intermediate aggregated message
+        self.search_llm_skill = LLMSkill(
+            llm=self._llm_skill_model,
+            system_prompt=system_prompt,
+            context_messages=self._build_search_context_messages,
+        )
 
     def _init_chains(self) -> List[Chain]:
         self.doc_retrieval_chain = Chain(
@@ -96,8 +141,7 @@ class AgentConfig:
             description=f"Information about {constants.COMPANY_NAME} ({constants.COMPANY_TICKER}) using a Google search",
             runners=[
                 Parallel(self.google_search_skill, self.google_news_skill),
-                self.google_aggregator_skill,
-                self.llm_skill,
+                self.search_llm_skill,
             ],
         )
 
@@ -109,23 +153,17 @@ class AgentConfig:
 
         return [self.doc_retrieval_chain, self.search_chain, self.pandas_chain]
 
-    @staticmethod
-    def _build_context_messages(context: SkillContext) -> List[LLMMessage]:
+    def _build_context_messages(self, context: SkillContext) -> List[LLMMessage]:
         """Context messages function for LLMSkill"""
+        return self._context_message_prompt.to_user_message(context)
 
-        prompt = """Use the following pieces of context to answer the query.
-        If the answer is not provided in the context, do not make up an answer. Instead, respond that you do not know.
-
-        CONTEXT:
-        {{chain_history.last_message}}
-        END CONTEXT.
-
-        QUERY:
-        {{chat_history.user.last_message}}
-        END QUERY.
-
-        YOUR ANSWER:
-        """
-        context_message_prompt = PromptToMessages(prompt_builder=PromptBuilder(prompt))
+    @staticmethod
+    def _build_search_context_messages(context: SkillContext) -> List[LLMMessage]:
+        """Context messages function for the search chain LLMSkill"""
+        from skills import build_search_context
 
-        return context_message_prompt.to_user_message(context)
+        prompt = ANSWER_PROMPT.substitute(
+            context=build_search_context(context),
+            query=context.chat_history.last_user_message.message,
+        )
+        return [LLMMessage.user_message(prompt)]
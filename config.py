@@ -1,96 +1,262 @@
+import functools
 import logging
-from typing import List, Optional
-
-import tiktoken
-from llama_index.indices.base import BaseIndex
-from transformers import AutoTokenizer
-from tiktoken import Encoding
-
-from llama_index import (
-    VectorStoreIndex,
-    SimpleDirectoryReader,
-    ServiceContext,
-    StorageContext,
-)
-from llama_index.langchain_helpers.text_splitter import TokenTextSplitter
-from llama_index.node_parser import SimpleNodeParser
-from llama_index import load_index_from_storage
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import List, TYPE_CHECKING
 
 import constants
+from embedding_cache import EmbeddingCache
 from utils import check_index_files
 
+if TYPE_CHECKING:
+    import faiss
+    from llama_index import VectorStoreIndex
+    from llama_index.embeddings.base import BaseEmbedding
+    from llama_index.langchain_helpers.text_splitter import TokenTextSplitter
+    from llama_index.node_parser import SimpleNodeParser
+    from llama_index.schema import BaseNode
+    from llama_index.vector_stores import FaissVectorStore
+    from tiktoken import Encoding
+
 
 class ChunkingTokenizer:
     """Tokenizer for chunking document data for creation of embeddings"""
 
     def __init__(self, model_name: str):
+        from transformers import AutoTokenizer
+
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
 
     def __call__(self, text: str) -> List[int]:
-        return self.tokenizer.encode(text)
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+
+@functools.lru_cache(maxsize=4)
+def get_encoding(encoding_name: str) -> "Encoding":
+    """Function to load a tiktoken encoding once per process"""
+    import tiktoken
+
+    encoding = tiktoken.get_encoding(encoding_name)
+    # Warm up the BPE cache so the first real token count does not pay for it
+    encoding.encode("warm up")
+    return encoding
+
+
+def build_text_splitter(tokenizer: ChunkingTokenizer) -> "TokenTextSplitter":
+    """Function to create the text splitter used to chunk document data"""
+    from llama_index.langchain_helpers.text_splitter import TokenTextSplitter
+
+    return TokenTextSplitter(
+        chunk_size=constants.MAX_CHUNK_SIZE,
+        chunk_overlap=constants.CHUNK_OVERLAP,
+        tokenizer=tokenizer,
+        separator="\n\n",
+        backup_separators=["\n", " "],
+    )
+
+
+def _load_and_split(path: str, embedding_model_name: str) -> List["BaseNode"]:
+    """Function to read a single document file and split it into nodes in a worker process"""
+    from llama_index import SimpleDirectoryReader
+    from llama_index.node_parser import SimpleNodeParser
+
+    node_parser = SimpleNodeParser(
+        text_splitter=build_text_splitter(ChunkingTokenizer(embedding_model_name))
+    )
+    documents = SimpleDirectoryReader(input_files=[path]).load_data()
+    return node_parser.get_nodes_from_documents(documents)
 
 
 class Config:
     """Configurations required for initializing the agent"""
 
-    _llm_tokenizer: Optional[Encoding] = None
-
     def __init__(
         self,
         encoding_name: str,
         embedding_model_name: str,
+        ef_search: int = constants.HNSW_EF_SEARCH,
     ):
         self._chunking_tokenizer = None
         self.encoding_name = encoding_name
         self.embedding_model_name = embedding_model_name
+        # Number of candidates explored by a HNSW search, trading recall for query speed
+        self.ef_search = ef_search
 
-    def initialize(self) -> VectorStoreIndex:
+    def initialize(self) -> "VectorStoreIndex":
         # Initialize tokenizer for text chunking
         self._chunking_tokenizer = ChunkingTokenizer(self.embedding_model_name)
 
         # Initialize text splitter
-        self._text_splitter = TokenTextSplitter(
-            chunk_size=constants.MAX_CHUNK_SIZE,
-            chunk_overlap=constants.CHUNK_OVERLAP,
-            tokenizer=self._chunking_tokenizer,
-            separator="\n\n",
-            backup_separators=["\n", " "],
-        )
+        self._text_splitter = build_text_splitter(self._chunking_tokenizer)
 
         # Initialize OpenAI LLM tokenizer
-        self.llm_tokenizer = tiktoken.get_encoding(self.encoding_name)
+        self.llm_tokenizer = get_encoding(self.encoding_name)
 
         # Initialize vector index
         return self._init_index()
 
-    def _init_index(self) -> VectorStoreIndex:
+    def _init_index(self) -> "VectorStoreIndex":
+        from llama_index import (
+            VectorStoreIndex,
+            ServiceContext,
+            StorageContext,
+            load_index_from_storage,
+        )
+        from llama_index.node_parser import SimpleNodeParser
+        from llama_index.vector_stores import FaissVectorStore
+
         node_parser = SimpleNodeParser(text_splitter=self._text_splitter)
         service_context = ServiceContext.from_defaults(
             embed_model=f"local:{self.embedding_model_name}", node_parser=node_parser
         )
+        # Embedding model shared with the retriever to embed queries
+        self.embed_model = service_context.embed_model
         index_id = constants.COMPANY_NAME
 
         if check_index_files(constants.PERSIST_DIR):
-            storage_context = StorageContext.from_defaults(
-                persist_dir=constants.PERSIST_DIR
-            )
-            index = load_index_from_storage(
-                storage_context=storage_context,
-                service_context=service_context,
-                index_id=index_id,
-            )
+            try:
+                vector_store = self._load_vector_store()
+            except RuntimeError:
+                # Indexes persisted before the switch to FAISS store their vectors as JSON
+                logging.warning(
+                    'message="persisted vector store is not a FAISS index, rebuilding index"'
+                )
+            else:
+                storage_context = StorageContext.from_defaults(
+                    vector_store=vector_store,
+                    persist_dir=constants.PERSIST_DIR,
+                )
+                index = load_index_from_storage(
+                    storage_context=storage_context,
+                    service_context=service_context,
+                    index_id=index_id,
+                )
 
-            return index
+                return index
 
-        # If index does not exist, initialize index
+        # If index does not exist or cannot be loaded, initialize index
         logging.info('message="initialize index started"')
-        # Create index
-        documents = SimpleDirectoryReader(constants.DOCUMENT_DATA_DIR).load_data()
-        index = VectorStoreIndex.from_documents(
-            documents, service_context=service_context
+        # Create index from nodes whose embeddings are reused from the embedding cache where possible
+        nodes = self._load_nodes(node_parser)
+        self._embed_nodes(nodes, service_context.embed_model)
+        nodes = self._order_by_similarity(nodes)
+        storage_context = StorageContext.from_defaults(
+            vector_store=FaissVectorStore(faiss_index=self._build_ann_index(nodes))
+        )
+        index = VectorStoreIndex(
+            nodes, storage_context=storage_context, service_context=service_context
         )
         index.set_index_id(index_id)
         # Save index to disk
         index.storage_context.persist(f"{constants.PERSIST_DIR}")
         logging.info('message="initialize index completed"')
         return index
+
+    def _load_vector_store(self) -> "FaissVectorStore":
+        """Load the persisted FAISS index, memory-mapping its vectors instead of reading them into RAM when embeddings are not cached"""
+        import faiss
+        from llama_index.vector_stores import FaissVectorStore
+
+        io_flags = 0
+        if not constants.CACHE_EMBEDDINGS:
+            if not hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+                raise ImportError(
+                    "CACHE_EMBEDDINGS = False requires faiss-cpu>=1.11.0 to memory-map the index vectors"
+                )
+            io_flags = faiss.IO_FLAG_MMAP_IFC
+        faiss_index = faiss.read_index(
+            os.path.join(constants.PERSIST_DIR, "vector_store.json"), io_flags
+        )
+        faiss_index.hnsw.efSearch = self.ef_search
+        return FaissVectorStore(faiss_index=faiss_index)
+
+    def _build_ann_index(self, nodes: List["BaseNode"]) -> "faiss.Index":
+        """Create an empty HNSW index storing int8 quantized vectors, trained on the node embeddings"""
+        import faiss
+        import numpy as np
+
+        embeddings = np.asarray([node.embedding for node in nodes], dtype=np.float32)
+        # Embeddings are normalized, so inner product ranks nodes by cosine similarity
+        faiss_index = faiss.IndexHNSWSQ(
+            embeddings.shape[1],
+            faiss.ScalarQuantizer.QT_8bit,
+            constants.HNSW_M,
+            faiss.METRIC_INNER_PRODUCT,
+        )
+        # Learn the per-dimension value ranges used to quantize each vector to int8
+        faiss_index.train(embeddings)
+        faiss_index.hnsw.efSearch = self.ef_search
+        return faiss_index
+
+    @staticmethod
+    def _order_by_similarity(nodes: List["BaseNode"]) -> List["BaseNode"]:
+        """Order nodes by embedding cluster so that similar chunks are stored next to each other on disk"""
+        import numpy as np
+        from sklearn.cluster import MiniBatchKMeans
+
+        n_clusters = math.ceil(math.sqrt(len(nodes)))
+        if n_clusters < 2:
+            return nodes
+
+        embeddings = np.asarray([node.embedding for node in nodes], dtype=np.float32)
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, n_init=3, random_state=0)
+        labels = kmeans.fit_predict(embeddings)
+        distances = np.linalg.norm(embeddings - kmeans.cluster_centers_[labels], axis=1)
+        # Sort by cluster, then by distance to the cluster centroid
+        order = np.lexsort((distances, labels))
+        return [nodes[i] for i in order]
+
+    def _load_nodes(self, node_parser: "SimpleNodeParser") -> List["BaseNode"]:
+        """Read and split the document files, using one worker process per file when there are several"""
+        from llama_index import SimpleDirectoryReader
+
+        paths = sorted(
+            entry.path
+            for entry in os.scandir(constants.DOCUMENT_DATA_DIR)
+            if entry.is_file() and not entry.name.startswith(".")
+        )
+        if len(paths) <= 1:
+            documents = SimpleDirectoryReader(constants.DOCUMENT_DATA_DIR).load_data()
+            return node_parser.get_nodes_from_documents(documents)
+
+        # Files are split independently, so chunk overlap never spans two workers.
+        # Workers re-import the main module where processes are spawned, so scripts need a __main__ guard
+        with ProcessPoolExecutor(
+            max_workers=min(len(paths), os.cpu_count() or 1)
+        ) as executor:
+            results = executor.map(
+                _load_and_split, paths, repeat(self.embedding_model_name)
+            )
+            return [node for nodes in results for node in nodes]
+
+    def _embed_nodes(self, nodes: List["BaseNode"], embed_model: "BaseEmbedding"):
+        """Set the embedding of each node, only calling the embedding model for chunks missing from the cache"""
+        from llama_index.schema import MetadataMode
+
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        hashes = [EmbeddingCache.hash_text(text) for text in texts]
+
+        with EmbeddingCache(
+            constants.EMBEDDING_CACHE_PATH,
+            provider="local",
+            model=self.embedding_model_name,
+        ) as cache:
+            embeddings = cache.get_many(hashes)
+            missing = {h: t for h, t in zip(hashes, texts) if h not in embeddings}
+            logging.info(
+                f'message="embedding cache hits: {len(nodes) - len(missing)}, misses: {len(missing)}"'
+            )
+            if missing:
+                fresh = dict(
+                    zip(
+                        missing.keys(),
+                        embed_model.get_text_embedding_batch(list(missing.values())),
+                    )
+                )
+                cache.put_many(fresh)
+                embeddings.update(fresh)
+
+        for node, h in zip(nodes, hashes):
+            node.embedding = embeddings[h]
@@ -9,6 +9,11 @@ COMPANY_TICKER = "MSFT"
 DOC_AND_GOOGLE_RETRIEVAL_LLM = "gpt-3.5-turbo"
 PANDAS_LLM = "gpt-3.5-turbo"
 CONTROLLER_LLM = "gpt-4"
+# Maximum number of open connections to the OpenAI API, shared by all LLMs
+OPENAI_MAX_CONNECTIONS = 10
+
+# Response filtering
+FILTER_CACHE_SIZE = 512
 
 # Document retrieval
 EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
@@ -17,3 +22,10 @@ MAX_CHUNK_SIZE = 256
 CHUNK_OVERLAP = 20
 CONTEXT_TOKEN_LIMIT = 3000
 NUM_RETRIEVED_DOCUMENTS = 50
+RETRIEVAL_CACHE_SIZE = 1024
+TOKEN_COUNT_CACHE_SIZE = 10000
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+# Set to False to memory-map the index vectors from disk instead of loading them into RAM
+CACHE_EMBEDDINGS = True
+EMBEDDING_CACHE_PATH = f"{PERSIST_DIR}/emb_cache.db"
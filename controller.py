@@ -5,20 +5,82 @@ from string import Template
 from council.chains import Chain, ChainBase
 from council.contexts import (
     AgentContext,
-    ScoredChatMessage,
     ChatMessage,
     ChatMessageKind,
-    LLMContext, ContextLogger,
+    ContextLogger,
 )
 from council.controllers import LLMController, ExecutionUnit
-from council.filters import FilterBase
 from council.llm import LLMMessage, LLMBase
 from council.utils import Option
 
-import constants
-
 logger = logging.getLogger(__name__)
 
+NO_CONVERSATIONAL_HISTORY = "No conversational history"
+
+# Instructions for subtask 1 when there is a conversational history to update the query from
+QUERY_UPDATE_INSTRUCTIONS = """# Use the historical conversation to update the user query to better answer the user question
+        # If the query does not need to be updated, do not update the query
+        # If there is no conversational history, do not update the query
+        # If the conversational history is not relevant to the query, do not update the query
+        # See the below examples for how to update the user query
+        ************
+        Example 1:
+        Conversational History:
+        User: Who is the CEO of OpenAI?
+        Assistant: Sam Altman
+        
+        User Query: How old is he?
+        
+        Updated Query: How old is Sam Altman?
+        ************
+        Example 2:
+        Conversational History:
+        User: Who is the CEO of OpenAI?
+        Assistant: Sam Altman
+        
+        User Query: What is the price of Bitcoin?
+        
+        Updated Query: What is the price of Bitcoin?
+        ************
+        """
+
+# Instructions for subtask 1 on the first turn of a conversation
+FIRST_TURN_INSTRUCTIONS = """# There is no conversational history, do not update the query
+        """
+
+CONTROLLER_PROMPT = Template(
+    """
+        Use the latest user query and the conversational history to identify the intent of the user. 
+        Break this task down into 2 subtasks. First perform subtask 1 and then subtask 2.
+        
+        Context for subtask 1:
+        Conversational history:
+        $conversational_history
+        
+        User query: $user_query
+        
+        Instructions for subtask 1:
+        $query_update_instructions
+        Context for subtask 2: 
+        Categories are given as a name and a category (name: {name}, description: {description}):
+        $answer_choices
+        
+        Instructions for subtask 2:
+        # Use the updated query to identify the intent of the user
+        # score categories out of 10 using there description
+        # For each category, you will answer with {name};{score};short justification"
+        # The updated query should be identical for each category
+        # Each response is provided on a new line
+        # When no category is relevant, you will answer exactly with 'unknown'
+                                        
+        Your response should always be formatted like this:
+        Subtask 1: {updated_query}
+        ---
+        Subtask 2:
+        {subtask2_results}
+        """
+)
+
 
 class Controller(LLMController):
     """
@@ -37,6 +99,18 @@ class Controller(LLMController):
             response_threshold (float): a minimum threshold to select a response from its score
         """
         super().__init__(chains, llm, response_threshold)
+        # Substitute the parts of the prompt that only depend on the chains once
+        answer_choices = "\n ".join(
+            [f"name: {c.name}, description: {c.description}" for c in self._chains]
+        )
+        self._prompt_template = Template(
+            CONTROLLER_PROMPT.safe_substitute(
+                answer_choices=answer_choices.replace("$", "$$")
+            )
+        )
+        self._system_message = LLMMessage.system_message(
+            "You are an assistant responsible to identify the intent of the user."
+        )
 
     def _execute(self, context: AgentContext) -> List[ExecutionUnit]:
         """Generates an execution plan for the agent based on the provided context, chains, and budget."""
@@ -87,77 +161,21 @@ class Controller(LLMController):
             return result
 
     def _build_llm_messages(self, context):
-        answer_choices = "\n ".join(
-            [f"name: {c.name}, description: {c.description}" for c in self._chains]
-        )
-        # Load prompts for LLM and substitute parameters
-        system_prompt = (
-            "You are an assistant responsible to identify the intent of the user."
-        )
-        controller_prompt = Template(
-            """
-        Use the latest user query and the conversational history to identify the intent of the user. 
-        Break this task down into 2 subtasks. First perform subtask 1 and then subtask 2.
-        
-        Context for subtask 1:
-        Conversational history:
-        $conversational_history
-        
-        User query: $user_query
-        
-        Instructions for subtask 1:
-        # Use the historical conversation to update the user query to better answer the user question
-        # If the query does not need to be updated, do not update the query
-        # If there is no conversational history, do not update the query
-        # If the conversational history is not relevant to the query, do not update the query
-        # See the below examples for how to update the user query
-        ************
-        Example 1:
-        Conversational History:
-        User: Who is the CEO of OpenAI?
-        Assistant: Sam Altman
-        
-        User Query: How old is he?
-        
-        Updated Query: How old is Sam Altman?
-        ************
-        Example 2:
-        Conversational History:
-        User: Who is the CEO of OpenAI?
-        Assistant: Sam Altman
-        
-        User Query: What is the price of Bitcoin?
-        
-        Updated Query: What is the price of Bitcoin?
-        ************
-        
-        Context for subtask 2: 
-        Categories are given as a name and a category (name: {name}, description: {description}):
-        $answer_choices
-        
-        Instructions for subtask 2:
-        # Use the updated query to identify the intent of the user
-        # score categories out of 10 using there description
-        # For each category, you will answer with {name};{score};short justification"
-        # The updated query should be identical for each category
-        # Each response is provided on a new line
-        # When no category is relevant, you will answer exactly with 'unknown'
-                                        
-        Your response should always be formatted like this:
-        Subtask 1: {updated_query}
-        ---
-        Subtask 2:
-        {subtask2_results}
-        """
-        )
-        user_prompt = controller_prompt.substitute(
-            conversational_history=self.build_chat_history(context),
+        # Substitute the per-query parameters of the prompt
+        conversational_history = self.build_chat_history(context)
+        user_prompt = self._prompt_template.substitute(
+            conversational_history=conversational_history,
             user_query=context.chat_history.last_user_message.message,
-            answer_choices=answer_choices,
+            # Query update rules and examples are only useful when there is a history to update from
+            query_update_instructions=(
+                FIRST_TURN_INSTRUCTIONS
+                if conversational_history == NO_CONVERSATIONAL_HISTORY
+                else QUERY_UPDATE_INSTRUCTIONS
+            ),
         )
         # Send messages and receive response from model
         messages = [
-            LLMMessage.system_message(system_prompt),
+            self._system_message,
             LLMMessage.user_message(user_prompt),
         ]
         return messages
@@ -165,87 +183,29 @@ class Controller(LLMController):
     @staticmethod
     def build_chat_history(context: AgentContext, max_history_len: int = 4) -> str:
         """Format the chat history into a string that can be added to the prompt for the query reformulation model."""
-        chat_history = ""
-        # Remove the user's most recent message from the chat history
-        message_history = list(context.chat_history.messages[:-1])
+        messages = context.chat_history.messages
+        num_messages = len(messages)
 
         # Return no history if there are less than 2 messages
-        if len(message_history) < 1:
-            return "No conversational history"
+        if num_messages <= 1:
+            return NO_CONVERSATIONAL_HISTORY
 
-        for msg in message_history[-max_history_len:]:
+        # Keep the last messages, excluding the user's most recent message
+        start = max(0, num_messages - 1 - max_history_len)
+        parts = []
+        for msg in messages[start : num_messages - 1]:
             if msg.is_of_kind(ChatMessageKind.User):
-                chat_history += f"User: {msg.message}\n"
-            if msg.is_of_kind(ChatMessageKind.Agent):
-                chat_history += f"Assistant: {msg.message}\n"
+                parts.append(f"User: {msg.message}\n")
+            elif msg.is_of_kind(ChatMessageKind.Agent):
+                parts.append(f"Assistant: {msg.message}\n")
 
-        return chat_history
+        return "".join(parts)
 
     @staticmethod
     def parse_response(response: str) -> Tuple[str, str]:
         """Function to separate reformulated query and chain selection from LLM response."""
-        query_reformulation_response = (
-            response.split("---")[0]
-            .replace("Subtask 1:", "")
-            .replace("Subtask 1: ", "")
-            .strip()
-        )
-        chain_selection_response = (
-            response.split("---")[1]
-            .replace("Subtask 2:", "")
-            .replace("Subtask 2: ", "")
-            .strip()
-        )
+        head, _, tail = response.partition("---")
+        query_reformulation_response = head.strip().removeprefix("Subtask 1:").strip()
+        chain_selection_response = tail.strip().removeprefix("Subtask 2:").strip()
 
         return query_reformulation_response, chain_selection_response
-
-
-class LLMFilter(FilterBase):
-    def __init__(self, llm: LLMBase):
-        super().__init__()
-        self._llm = self.new_monitor("llm", llm)
-
-    def _execute(self, context: AgentContext) -> List[ScoredChatMessage]:
-        """Selects responses from the agent's context."""
-        messages = self._build_llm_messages(context)
-        llm_response = self._llm.inner.post_chat_request(
-            LLMContext.from_context(context, self._llm), messages=messages
-        )
-
-        return [ScoredChatMessage(ChatMessage.agent(llm_response.first_choice), 1.0)]
-
-    def _build_llm_messages(self, context: AgentContext) -> List[LLMMessage]:
-        agent_messages = list(context.evaluation)
-        query = context.chat_history.last_user_message.message
-        context = ""
-        for message in agent_messages:
-            context += f"Response: {message.message.message}\n\n"
-
-        filter_prompt = Template(
-            """
-        # Instructions
-        - The provided context is a list of research data answering the user query from different sources.
-        - Combine the following data from multiple sources into a single research report to answer the query.
-        - Make sure to highlight any agreements or disagreements between different responses in the final response.
-        - Explicitly state from which source different parts of the final response are from.
-        
-        # Context:
-        $context
-        
-        # Query:
-        $query
-        
-        Answer:
-        """
-        )
-        prompt = filter_prompt.substitute(context=context, query=query)
-        return [
-            self._build_system_prompt(company=constants.COMPANY_NAME),
-            LLMMessage.user_message(prompt),
-        ]
-
-    def _build_system_prompt(self, company: str) -> LLMMessage:
-        system_prompt = Template(
-            "You are a financial analyst whose job is to write a research report answering the user query based on data about $company from different sources."
-        ).substitute(company=company)
-        return LLMMessage.system_message(system_prompt)
@@ -0,0 +1,69 @@
+import hashlib
+import os
+import sqlite3
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+# Keep the number of bound parameters per query below sqlite's default limit
+_MAX_QUERY_PARAMS = 500
+
+
+class EmbeddingCache:
+    """Embeddings of text chunks persisted to a sqlite file, keyed on a hash of the chunk content"""
+
+    def __init__(self, path: str, provider: str, model: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.provider = provider
+        self.model = model
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(hash TEXT PRIMARY KEY, provider TEXT, model TEXT, vec BLOB)"
+        )
+
+    def __enter__(self) -> "EmbeddingCache":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        """Function to compute the cache key of a text chunk"""
+        return hashlib.blake2b(text.encode()).hexdigest()
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        """Return the cached embeddings found for the given hashes"""
+        hashes = list(set(hashes))
+        result = {}
+        for start in range(0, len(hashes), _MAX_QUERY_PARAMS):
+            batch = hashes[start : start + _MAX_QUERY_PARAMS]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._connection.execute(
+                f"SELECT hash, vec FROM embeddings WHERE provider = ? AND model = ? AND hash IN ({placeholders})",
+                [self.provider, self.model, *batch],
+            )
+            for key, vec in rows:
+                result[key] = np.frombuffer(vec, dtype=np.float32).tolist()
+
+        return result
+
+    def put_many(self, embeddings: Dict[str, List[float]]) -> None:
+        """Store the given embeddings, replacing any existing entry with the same hash"""
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (hash, provider, model, vec) VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        key,
+                        self.provider,
+                        self.model,
+                        np.asarray(vec, dtype=np.float32).tobytes(),
+                    )
+                    for key, vec in embeddings.items()
+                ],
+            )
@@ -10,18 +10,21 @@ import dotenv
 
 dotenv.load_dotenv()
 
-from council.agents import Agent
 from council.contexts import AgentContext, Budget
 
+from agent import ParallelAgent
 from agent_config import AgentConfig
 
-# Loading all agent configuration into an Agent class
-agent = Agent(**AgentConfig().load_config())
-# Initializing context for the Agent
-run_context = AgentContext.from_user_message(
-    "What is the financial performance of Microsoft?", budget=Budget(600)
-)
-# Executing Agent
-result = agent.execute(run_context)
-print(f"\nresult:\n{result.best_message.message}")
-print(f"\nexecution log:\n{run_context.execution_log_to_json()}")
+# Worker processes used to build the index re-import this module on platforms that spawn them,
+# so the agent must only be built and run when executed as a script
+if __name__ == "__main__":
+    # Loading all agent configuration into an Agent class running the selected chains concurrently
+    agent = ParallelAgent(**AgentConfig().load_config())
+    # Initializing context for the Agent
+    run_context = AgentContext.from_user_message(
+        "What is the financial performance of Microsoft?", budget=Budget(600)
+    )
+    # Executing Agent
+    result = agent.execute(run_context)
+    print(f"\nresult:\n{result.best_message.message}")
+    print(f"\nexecution log:\n{run_context.execution_log_to_json()}")
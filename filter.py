@@ -1,5 +1,7 @@
-from string import Template
-from typing import List
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Sequence
 
 from council.contexts import AgentContext, ScoredChatMessage, LLMContext, ChatMessage
 from council.filters import FilterBase
@@ -7,53 +9,95 @@ from council.llm import LLMBase, LLMMessage
 
 import constants
 
+SYSTEM_PROMPT = """You are a financial analyst whose job is to write a research report answering the user query based on data about {company} from different sources.
+
+# Instructions
+- The provided context is a list of research data answering the user query from different sources.
+- Combine the following data from multiple sources into a single research report to answer the query.
+- Make sure to highlight any agreements or disagreements between different responses in the final response.
+- Explicitly state from which source different parts of the final response are from.
+"""
+
+SELECT_RESPONSE_PROMPT = """# Context:
+{context}
+
+# Query:
+{query}
+
+Answer:
+"""
+
+NO_RESPONSE_MESSAGE = "I could not find any data to answer the query."
+
 
 class LLMFilter(FilterBase):
+    """
+    A filter that uses an LLM to combine the responses of the chains into a single research report.
+    A single successful response is returned as is, without calling the LLM.
+
+    All static instructions are in the system message, which is identical across calls, and the dynamic
+    context and query come last in the user message. Keep this ordering so that LLM providers can reuse
+    their cached prompt prefix between calls.
+    """
+
     def __init__(self, llm: LLMBase):
         super().__init__()
         self._llm = self.new_monitor("llm", llm)
+        # The system prompt only depends on the company, so it is built once
+        self._system_message = LLMMessage.system_message(
+            SYSTEM_PROMPT.format(company=constants.COMPANY_NAME)
+        )
+        # Most recently used reports, keyed on a hash of the query and the chain responses
+        self._response_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._response_cache_lock = threading.Lock()
 
     def _execute(self, context: AgentContext) -> List[ScoredChatMessage]:
         """Selects responses from the agent's context."""
-        messages = self._build_llm_messages(context)
+        # There is nothing to combine without at least two responses, so the LLM is not needed,
+        # unless the only response is an error that the LLM has to turn into a reply
+        evaluation = context.evaluation
+        if len(evaluation) == 0:
+            return [ScoredChatMessage(ChatMessage.agent(NO_RESPONSE_MESSAGE), 1.0)]
+        if (
+            len(evaluation) == 1
+            and evaluation[0].score > 0
+            and evaluation[0].message.is_ok
+        ):
+            return [evaluation[0]]
+
+        query = context.chat_history.last_user_message.message
+        key = self._cache_key(query, evaluation)
+        with self._response_cache_lock:
+            response = self._response_cache.get(key)
+            if response is not None:
+                self._response_cache.move_to_end(key)
+                return [ScoredChatMessage(ChatMessage.agent(response), 1.0)]
+
+        messages = self._build_llm_messages(query, evaluation)
         llm_response = self._llm.inner.post_chat_request(
             LLMContext.from_context(context, self._llm), messages=messages
         )
+        response = llm_response.first_choice
 
-        return [ScoredChatMessage(ChatMessage.agent(llm_response.first_choice), 1.0)]
+        with self._response_cache_lock:
+            self._response_cache[key] = response
+            if len(self._response_cache) > constants.FILTER_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
 
-    def _build_llm_messages(self, context: AgentContext) -> List[LLMMessage]:
-        agent_messages = list(context.evaluation)
-        query = context.chat_history.last_user_message.message
-        context = ""
-        for message in agent_messages:
-            context += f"Response: {message.message.message}\n\n"
-
-        select_response_prompt = Template(
-            """
-        # Instructions
-        - The provided context is a list of research data answering the user query from different sources.
-        - Combine the following data from multiple sources into a single research report to answer the query.
-        - Make sure to highlight any agreements or disagreements between different responses in the final response.
-        - Explicitly state from which source different parts of the final response are from.
-        
-        # Context:
-        $context
-        
-        # Query:
-        $query
-        
-        Answer:
-        """
+        return [ScoredChatMessage(ChatMessage.agent(response), 1.0)]
+
+    @staticmethod
+    def _cache_key(query: str, evaluation: Sequence[ScoredChatMessage]) -> str:
+        """Function to compute the response cache key from the user query and the chain responses"""
+        responses = "\0".join(message.message.message for message in evaluation)
+        return hashlib.sha256(f"{query}\0{responses}".encode()).hexdigest()
+
+    def _build_llm_messages(
+        self, query: str, evaluation: Sequence[ScoredChatMessage]
+    ) -> List[LLMMessage]:
+        responses = "".join(
+            f"Response: {message.message.message}\n\n" for message in evaluation
         )
-        prompt = select_response_prompt.substitute(context=context, query=query)
-        return [
-            self._build_system_prompt(company=constants.COMPANY_NAME),
-            LLMMessage.user_message(prompt),
-        ]
-
-    def _build_system_prompt(self, company: str) -> LLMMessage:
-        system_prompt = Template(
-            "You are a financial analyst whose job is to write a research report answering the user query based on data about $company from different sources."
-        ).substitute(company=company)
-        return LLMMessage.system_message(system_prompt)
+
+        prompt = SELECT_RESPONSE_PROMPT.format(context=responses, query=query)
+        return [self._system_message, LLMMessage.user_message(prompt)]
@@ -0,0 +1,62 @@
+from typing import Any, Optional
+
+import httpx
+from council.llm import (
+    OpenAIChatCompletionsModel,
+    OpenAILLMConfiguration,
+    OpenAITokenCounter,
+)
+
+import constants
+
+OPENAI_CHAT_COMPLETIONS_URL = "https://api.openai.com/v1/chat/completions"
+
+# HTTP client shared by every OpenAI model, so that connections are kept alive and reused across requests
+_client = httpx.Client(
+    limits=httpx.Limits(
+        max_connections=constants.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=constants.OPENAI_MAX_CONNECTIONS,
+    )
+)
+
+
+class PooledOpenAIProvider:
+    """
+    Provider that posts chat completion requests through the shared HTTP client.
+
+    Based on OpenAIChatCompletionsModelProvider: https://github.com/chain-ml/council/blob/main/council/llm/openai_llm.py
+    """
+
+    def __init__(self, config: OpenAILLMConfiguration):
+        self.config = config
+
+    def post_request(self, payload: dict[str, Any]) -> httpx.Response:
+        headers = {
+            "Authorization": self.config.authorization,
+            "Content-Type": "application/json",
+        }
+        return _client.post(
+            url=OPENAI_CHAT_COMPLETIONS_URL,
+            headers=headers,
+            json=payload,
+            # Same as council's provider: httpx default timeouts, with the configured read timeout
+            timeout=httpx.Timeout(5.0, read=self.config.timeout),
+        )
+
+
+class PooledOpenAILLM(OpenAIChatCompletionsModel):
+    """
+    OpenAI LLM sending its requests through a connection pool shared with the other models, instead of
+    opening a new connection for every request like council's OpenAILLM.
+    """
+
+    def __init__(self, config: OpenAILLMConfiguration):
+        super().__init__(
+            config,
+            PooledOpenAIProvider(config).post_request,
+            token_counter=OpenAITokenCounter.from_model(config.model.unwrap_or("")),
+        )
+
+    @staticmethod
+    def from_env(model: Optional[str] = None) -> "PooledOpenAILLM":
+        return PooledOpenAILLM(OpenAILLMConfiguration.from_env(model=model))
@@ -1,42 +1,210 @@
-from llama_index.indices.vector_store import VectorIndexRetriever
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Iterable, Iterator, List, Optional, TYPE_CHECKING
+
+import numpy as np
 
 import constants
 from config import Config
 
-from typing import List
-from llama_index.schema import NodeWithScore
+if TYPE_CHECKING:
+    from llama_index.indices.query.schema import QueryBundle
+    from llama_index.indices.vector_store import VectorIndexRetriever
+    from llama_index.schema import NodeWithScore
+
+logger = logging.getLogger(__name__)
+
+# Rough number of characters per LLM token, and the margin applied to estimates based on it
+# when sizing the batches of docs to tokenize
+_CHARS_PER_TOKEN = 4
+_ESTIMATE_MARGIN = 1.5
+
+
+def _cache_key(embedding: List[float]) -> bytes:
+    """Function to key cached retrieval results on a query embedding, ignoring differences in its scale"""
+    vector = np.asarray(embedding, dtype=np.float32)
+    vector /= np.linalg.norm(vector) or 1.0
+    return vector.astype(np.float16).tobytes()
+
+
+def _take_docs(texts: Iterator[str], max_chars: float) -> List[str]:
+    """Function to take the next docs within a character budget, plus the first one past it"""
+    docs = []
+    num_chars = 0
+    for text in texts:
+        doc = text + "\n\n"
+        docs.append(doc)
+        num_chars += len(doc)
+        if num_chars > max_chars:
+            break
+
+    return docs
 
 
 class Retriever:
     """Class to retrieve text chunks from Llama Index and create context for LLM."""
 
-    def __init__(self, config: Config, retriever: VectorIndexRetriever):
+    def __init__(self, config: Config, retriever: "VectorIndexRetriever"):
         self.llm_tokenizer = config.llm_tokenizer
         self.retriever = retriever
+        self._embed_model = config.embed_model
+        # Embeddings of previously seen queries, evicting the least recently used first
+        self._query_embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_embedding_lock = threading.Lock()
+        # Most recently used retrieval results, keyed on the float16 bytes of the normalized query embedding
+        self._node_cache: "OrderedDict[bytes, List[NodeWithScore]]" = OrderedDict()
+        self._node_cache_lock = threading.Lock()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        # Token counts of previously seen docs, keyed on the hash of their text and evicted oldest first
+        self._token_counts: "OrderedDict[int, int]" = OrderedDict()
+        self._token_count_lock = threading.Lock()
 
     def retrieve_docs(self, query) -> str:
         """End-to-end function to retrieve most similar nodes and build the context"""
-        nodes = self.retriever.retrieve(query)
-        docs = self._extract_text(nodes)
-        context = self._build_context(docs)
+        (embedding,) = self._embed_queries([query])
+        return self._retrieve_context(self._build_query_bundle(query, embedding))
 
-        return context
+    async def aretrieve_docs(self, query) -> str:
+        """Async version of retrieve_docs, allowing several queries to be retrieved concurrently with asyncio.gather"""
+        # Embedding, vector search and tokenization are blocking calls that release the GIL,
+        # so they run in a worker thread to overlap with other queries
+        return await asyncio.to_thread(self.retrieve_docs, query)
+
+    def retrieve_docs_batch(self, queries: List[str]) -> List[str]:
+        """Function to build the context for several queries, retrieving them concurrently. Must not be called from a running event loop."""
+        return asyncio.run(self.aretrieve_docs_batch(queries))
+
+    async def aretrieve_docs_batch(self, queries: List[str]) -> List[str]:
+        """Async version of retrieve_docs_batch, embedding the distinct queries together and searching for each one once"""
+        unique_queries = list(dict.fromkeys(queries))
+        embeddings = await asyncio.to_thread(self._embed_queries, unique_queries)
+        # The vector index has no batch search, so each query is searched in its own worker thread
+        contexts = await asyncio.gather(
+            *(
+                asyncio.to_thread(
+                    self._retrieve_context, self._build_query_bundle(query, embedding)
+                )
+                for query, embedding in zip(unique_queries, embeddings)
+            )
+        )
+        context_by_query = dict(zip(unique_queries, contexts))
+
+        return [context_by_query[query] for query in queries]
 
     @staticmethod
-    def _extract_text(nodes: List[NodeWithScore]) -> List[str]:
-        """Function to extract the text from the retrieved nodes"""
-        return [node.node.text for node in nodes]
+    def _build_query_bundle(query: str, embedding: List[float]) -> "QueryBundle":
+        """Function to create the query for the vector index with its embedding, so that it is only embedded once"""
+        from llama_index.indices.query.schema import QueryBundle
+
+        return QueryBundle(query_str=query, embedding=embedding)
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Function to embed queries, embedding the queries not seen before in one call to the embedding model"""
+        with self._query_embedding_lock:
+            embeddings = [self._query_embeddings.get(query) for query in queries]
+            for query, embedding in zip(queries, embeddings):
+                if embedding is not None:
+                    self._query_embeddings.move_to_end(query)
 
-    def _build_context(self, docs: List[str]) -> str:
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            # The sentence-transformers model embeds queries the same way as texts,
+            # so its batch text embedding gives the query embeddings in a single forward pass
+            fresh = self._embed_model.get_text_embedding_batch(
+                [queries[i] for i in missing]
+            )
+            with self._query_embedding_lock:
+                for i, embedding in zip(missing, fresh):
+                    embeddings[i] = self._query_embeddings[queries[i]] = embedding
+                while len(self._query_embeddings) > constants.RETRIEVAL_CACHE_SIZE:
+                    self._query_embeddings.popitem(last=False)
+
+        return embeddings
+
+    def _retrieve_context(self, query_bundle: "QueryBundle") -> str:
+        """Function to build the context from the most similar nodes for an embedded query"""
+        nodes = self._retrieve_nodes(query_bundle)
+        context = self._build_context(node.node.text for node in nodes)
+
+        return context
+
+    def _retrieve_nodes(self, query_bundle: "QueryBundle") -> List["NodeWithScore"]:
+        """Function to retrieve the most similar nodes for a query, reusing the results of a previous identical query"""
+        nodes = self._get_cached_nodes(query_bundle.embedding)
+        if nodes is None:
+            nodes = self.retriever.retrieve(query_bundle)
+            self._cache_nodes(query_bundle.embedding, nodes)
+
+        return nodes
+
+    def _get_cached_nodes(
+        self, embedding: List[float]
+    ) -> Optional[List["NodeWithScore"]]:
+        """Function to return the nodes retrieved by a previous query with the same embedding, if any"""
+        key = _cache_key(embedding)
+        with self._node_cache_lock:
+            nodes = self._node_cache.get(key)
+            if nodes is None:
+                self._cache_misses += 1
+                logger.debug(
+                    f'message="retrieval cache miss" hits={self._cache_hits} misses={self._cache_misses}'
+                )
+                return None
+
+            self._node_cache.move_to_end(key)
+            self._cache_hits += 1
+            logger.debug(
+                f'message="retrieval cache hit" hits={self._cache_hits} misses={self._cache_misses}'
+            )
+            return nodes
+
+    def _cache_nodes(self, embedding: List[float], nodes: List["NodeWithScore"]):
+        """Function to store the nodes retrieved for a query embedding, evicting the least recently used entry"""
+        with self._node_cache_lock:
+            self._node_cache[_cache_key(embedding)] = nodes
+            if len(self._node_cache) > constants.RETRIEVAL_CACHE_SIZE:
+                self._node_cache.popitem(last=False)
+
+    def _build_context(self, texts: Iterable[str]) -> str:
         """Function to build context for LLM by separating text chunks into paragraphs"""
-        context = ""
+        texts = iter(texts)
+        context = []
         num_tokens = 0
-        for doc in docs:
-            doc += "\n\n"
-            num_tokens += len(self.llm_tokenizer.encode(doc))
-            if num_tokens <= constants.CONTEXT_TOKEN_LIMIT:
-                context += doc
-            else:
-                break
+        # Tokenize the docs in batches sized from their character count, so that the docs past the
+        # token limit are usually never tokenized. The token count itself is exact, so the docs kept
+        # are the same as when counting every doc one at a time
+        while True:
+            max_chars = (
+                (constants.CONTEXT_TOKEN_LIMIT - num_tokens)
+                * _CHARS_PER_TOKEN
+                * _ESTIMATE_MARGIN
+            )
+            docs = _take_docs(texts, max_chars)
+            if not docs:
+                return "".join(context)
 
-        return context
+            for doc, doc_tokens in zip(docs, self._count_tokens(docs)):
+                num_tokens += doc_tokens
+                if num_tokens > constants.CONTEXT_TOKEN_LIMIT:
+                    return "".join(context)
+                context.append(doc)
+
+    def _count_tokens(self, docs: List[str]) -> List[int]:
+        """Function to count the tokens of each doc, tokenizing the docs not seen before in one call"""
+        keys = [hash(doc) for doc in docs]
+        with self._token_count_lock:
+            counts = [self._token_counts.get(key) for key in keys]
+
+        missing = [i for i, count in enumerate(counts) if count is None]
+        if missing:
+            encoded = self.llm_tokenizer.encode_batch([docs[i] for i in missing])
+            with self._token_count_lock:
+                for i, tokens in zip(missing, encoded):
+                    counts[i] = self._token_counts[keys[i]] = len(tokens)
+                while len(self._token_counts) > constants.TOKEN_COUNT_CACHE_SIZE:
+                    self._token_counts.popitem(last=False)
+
+        return counts
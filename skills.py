@@ -1,9 +1,11 @@
 import json
+from typing import Any, Dict, List
 
 from council.contexts import SkillContext, ChatMessage
 from council.skills import SkillBase
 from council.skills.google import GoogleSearchSkill, GoogleNewsSkill
 
+import pandas as pd
 from pandasai import PandasAI
 from pandasai.llm.openai import OpenAI
 
@@ -66,33 +68,26 @@ class CustomGoogleNewsSkill(GoogleNewsSkill):
         return self.build_error_message("no response")
 
 
-class GoogleAggregatorSkill(SkillBase):
-    """Skill to aggregate results from Google Search and Google News"""
+def build_search_context(context: SkillContext) -> str:
+    """Function to build context for LLM from the Google Search and Google News results"""
+    gsearch_results, gnews_results = (
+        _load_search_results(context, skill_name) for skill_name in ("gsearch", "gnews")
+    )
 
-    def __init__(
-        self,
-    ):
-        super().__init__(name="google_aggregator")
+    return "".join(
+        [
+            result.get("title", "") + " " + result.get("snippet", "") + "\n\n"
+            for result in gsearch_results + gnews_results
+        ]
+    )
 
-    def execute(self, context: SkillContext) -> ChatMessage:
-        gsearch_results = (
-            json.loads(context.current.last_message_from_skill("gsearch").data)
-            if context.current.last_message_from_skill("gsearch").is_ok
-            else []
-        )
-        gnews_results = (
-            json.loads(context.current.last_message_from_skill("gnews").data)
-            if context.current.last_message_from_skill("gnews").is_ok
-            else []
-        )
-        search_results = gsearch_results + gnews_results
-
-        context = ""
-        for result in search_results:
-            text = result.get("title", "") + " " + result.get("snippet", "") + "\n\n"
-            context += text
 
-        return self.build_success_message(context)
+def _load_search_results(
+    context: SkillContext, skill_name: str
+) -> List[Dict[str, Any]]:
+    """Function to load the results of a search skill, looking up its last message once"""
+    message = context.current.last_message_from_skill(skill_name)
+    return json.loads(message.data) if message.is_ok else []
 
 
 class PandasSkill(SkillBase):
@@ -105,11 +100,13 @@ class PandasSkill(SkillBase):
     def __init__(self, api_token, model):
         super().__init__(name="pandas")
         self.llm = OpenAI(api_token=api_token, model=model)
+        self._df = None
 
     def execute(self, context: SkillContext) -> ChatMessage:
         query = context.current.last_message.message
 
-        df = read_file_to_df(get_filename(constants.MARKET_DATA_DIR))
+        # Copy the market data so that code generated by PandasAI cannot modify it for later queries
+        df = self._load_df().copy()
         pandas_ai = PandasAI(self.llm, conversational=True)
 
         try:
@@ -124,3 +121,9 @@ class PandasSkill(SkillBase):
             return self.build_error_message(
                 f"PandasAI failed due to following error: {e}"
             )
+
+    def _load_df(self) -> pd.DataFrame:
+        """Read the market data the first time it is needed instead of parsing it for every query"""
+        if self._df is None:
+            self._df = read_file_to_df(get_filename(constants.MARKET_DATA_DIR))
+        return self._df
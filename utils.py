@@ -1,29 +1,73 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
 import pandas as pd
 
 
 def check_index_files(directory: str) -> bool:
     """Function to check whether there is a LlamaIndex index for document retrieval persisted to disk."""
-    expected_files = {
+    expected_files = (
         "docstore.json",
         "graph_store.json",
         "index_store.json",
         "vector_store.json",
-    }
-    actual_files = set(os.listdir(directory)) & expected_files
-    return expected_files == actual_files
+    )
+    # Probe each expected file instead of listing the whole directory
+    return all(os.path.isfile(os.path.join(directory, name)) for name in expected_files)
 
 
 def get_filename(directory: str) -> str:
     """Function to return single file from a directory"""
-    return os.path.join(directory, os.listdir(directory)[0])
+    # Stop at the first entry instead of listing the whole directory
+    with os.scandir(directory) as entries:
+        try:
+            return next(entries).path
+        except StopIteration:
+            raise FileNotFoundError(
+                f"No file found in directory: {directory}"
+            ) from None
 
 
 def read_file_to_df(filename: str) -> pd.DataFrame:
     """Function that reads a file to a pandas DataFrame based on file extension."""
     if filename.endswith(".csv"):
-        return pd.read_csv(filename)
+        try:
+            import pyarrow as pa
+            from pyarrow import csv
+        except ImportError:
+            return pd.read_csv(filename)
+
+        # Multi-threaded parsing with pyarrow, reading the file through a memory map.
+        # Dates are kept as strings and empty strings are read as missing values, as the default parser does,
+        # so PandasAI sees the same data
+        convert_options = csv.ConvertOptions(
+            column_types={"Date": pa.string()}, strings_can_be_null=True
+        )
+        try:
+            with pa.memory_map(filename) as source:
+                return csv.read_csv(source, convert_options=convert_options).to_pandas()
+        except pa.ArrowInvalid:
+            # Fall back to the default parser, which also handles inputs pyarrow rejects
+            return pd.read_csv(filename)
     elif filename.endswith(".json"):
         return pd.read_json(filename)
     else:
         raise ValueError(f"Unsupported file type: {filename}")
+
+
+def read_files_to_df(filenames: List[str]) -> pd.DataFrame:
+    """
+    Function that reads several files to a single pandas DataFrame, parsing each file in a worker process.
+
+    Workers re-import the main module on platforms that spawn processes, so scripts calling this need a __main__ guard.
+    """
+    if len(filenames) == 0:
+        raise ValueError("No files to read")
+    if len(filenames) == 1:
+        return read_file_to_df(filenames[0])
+
+    with ProcessPoolExecutor(
+        max_workers=min(len(filenames), os.cpu_count() or 1)
+    ) as executor:
+        return pd.concat(executor.map(read_file_to_df, filenames), ignore_index=True)